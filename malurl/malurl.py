@@ -1,20 +1,160 @@
 # Copyright: 2022, Alexan Mardigian
 
-import json
+import aiohttp
+import asyncio
+import re
 import requests
-from typing import Dict, List
-from validators import ValidationFailure, url as validate_url
-from urllib.parse import quote_plus
+import socket
+import sys
+import time
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from typing import Dict, Final, List
+from urllib.parse import quote_plus, urlsplit
 from rainbowprint import rprint
 
-DOES_NOT_EXIST = -999
-NA = 'N/A'
+# orjson parses JSON straight from bytes and is several times faster
+# than the stdlib json module.  Fall back to stdlib if unavailable.
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+BASE = 'https://www.ipqualityscore.com/api/json/url'
+
+_URL_RE = re.compile(r'^https?://[^\s/$.?#].[^\s]*$', re.IGNORECASE)
+
+# Every request goes to the same IPQS hostname, so cache its DNS
+# resolution instead of hitting the resolver on every new connection.
+# requests/urllib3 resolve through socket.getaddrinfo, which has no
+# cache of its own and no per-session hook, so the wrapper below is
+# installed while at least one MalURL is open.  Lookups for any other
+# hostname pass straight through untouched, cached entries expire by
+# TTL bucket, and closing the last MalURL restores the original
+# resolver.
+_IPQS_HOST = urlsplit(BASE).hostname
+_original_getaddrinfo = socket.getaddrinfo
+_dns_cache_users = 0
+
+@lru_cache(maxsize=8)
+def _cached_getaddrinfo(host, port, family, type, proto, flags,
+                        bucket) -> list:
+    return _original_getaddrinfo(host, port, family, type, proto, flags)
+
+def _getaddrinfo(host, port, family=0, type=0, proto=0, flags=0) -> list:
+    if host != _IPQS_HOST:
+        return _original_getaddrinfo(host, port, family, type, proto, flags)
+
+    bucket = int(time.monotonic() // DNS_TTL)
+    return _cached_getaddrinfo(host, port, family, type, proto, flags,
+                               bucket)
+
+def _install_dns_cache() -> None:
+    global _dns_cache_users
+    _dns_cache_users += 1
+    socket.getaddrinfo = _getaddrinfo
+
+def _uninstall_dns_cache() -> None:
+    global _dns_cache_users
+    _dns_cache_users = max(0, _dns_cache_users - 1)
+
+    if _dns_cache_users == 0:
+        socket.getaddrinfo = _original_getaddrinfo
+
+def _field(key: str, default: object, cast: type=None, doc: str=None):
+    """
+    Builds a MalURL getter that reads one field from self.results,
+    applying cast (if given) and falling back to default when the
+    field is missing.  Collapsing the near-identical getters into
+    this single closure keeps each call to one dict.get.
+    """
+    if cast is None:
+        def getter(self) -> object:
+            return self.results.get(key, default)
+    else:
+        def getter(self) -> object:
+            return cast(self.results.get(key, default))
+
+    getter.__name__ = key
+    getter.__qualname__ = f'MalURL.{key}'
+    getter.__doc__ = doc
+    getter.__annotations__['return'] = cast if cast else type(default)
+    return getter
+
+DOES_NOT_EXIST: Final[int] = -999
+NA: Final[str] = 'N/A'
+
+REQUEST_TIMEOUT = 10  # Seconds.
+CACHE_TTL = 3600      # Seconds.
+DNS_TTL = 600         # Seconds.
 
 class MalURL:
+    __slots__ = ('apikey', 'strictness', 'results', '_session',
+                 '_url_prefix', '_closed', '_fetch_cached')
+
     def __init__(self, apikey: str, strictness: int=0) -> None:
         self.apikey = apikey
         self.strictness = strictness
         self.results = {}
+        self._url_prefix = f'{BASE}/{apikey}/'
+        # Every request goes to the same IPQS host, so a single
+        # pooled session lets consecutive fetches reuse the same
+        # Keep-Alive connection and skip the TLS handshake.
+        self._session = requests.Session()
+        # Transient 5xx/429 responses are retried with exponential
+        # backoff over the pooled connection, so a hiccup does not
+        # force the caller to re-run the whole fetch.  Once retries
+        # are exhausted the last response is returned rather than
+        # raised, so _fetch can surface the real upstream status.
+        retries = Retry(total=3, backoff_factor=0.3,
+                        status_forcelist=(429, 500, 502, 503, 504),
+                        allowed_methods=('GET',),
+                        raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=20,
+                              max_retries=retries)
+        self._session.mount('https://', adapter)
+        # The response cache lives on the instance, so a closed
+        # scanner, its session, and its cached bodies can all be
+        # garbage collected together.
+        self._fetch_cached = lru_cache(maxsize=1024)(self._fetch)
+        self._closed = False
+        _install_dns_cache()
+
+    def __enter__(self) -> 'MalURL':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes the underlying HTTP session and its pooled connections.
+        Once the last open MalURL is closed, the process-wide DNS
+        resolver is restored as well.
+
+        Parameters
+        ----------
+        None.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        _uninstall_dns_cache()
+        self._session.close()
+
+    def clear_cache(self) -> None:
+        """
+        Empties this scanner's cache of IP Quality Score responses.
+
+        Parameters
+        ----------
+        None.
+        """
+        self._fetch_cached.cache_clear()
 
     def fetch(self, url: str) -> None:
         """
@@ -31,29 +171,105 @@ class MalURL:
             self.results = self._no_results(404, f"Invalid url {url}")
             return
 
-        BASE = 'https://www.ipqualityscore.com/api/json/url'
-        encoded_url = quote_plus(url)
-        api_url = f'{BASE}/{self.apikey}/{encoded_url}?{self.strictness}'
-
         try:
-            response = requests.get(api_url)
-            self.results = json.loads(response.content.decode('utf-8'))
-            
+            # The time bucket keys the cache to the current CACHE_TTL
+            # window, so stale entries expire by missing the cache.
+            bucket = int(time.monotonic() // CACHE_TTL)
+            status, content = self._fetch_cached(url, self.strictness, bucket)
+
+            # IPQS surfaces an exhausted quota either as an HTTP 402
+            # or in the response body; the HTTP case is caught here
+            # before paying for the JSON decode.
+            if status == 402:
+                msg = 'You have exceeded your request quota.'
+                self.results = self._no_results(402, msg)
+                return
+
+            self.results = _json_loads(content)
+
             # If we have exceeded our API request quota, then modify
             # the results with a 402 (payment required) status_code.
             req = 'You have exceeded your request quota'
             msg = self.message()
             if not self.success() and req in msg:
                 self.results = self._no_results(402, msg)
-        except requests.exceptions.ConnectionError:
+        except requests.exceptions.HTTPError as error:
+            msg = "Upstream error from IP Quality Score API."
+            self.results = self._no_results(error.response.status_code, msg)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.RetryError,
+                requests.exceptions.Timeout):
             msg = "Failed to establish connection to IP Quality Score API."
             self.results = self._no_results(503, msg)
 
+    async def fetch_many(self, urls: List[str],
+                         concurrency: int=20) -> List[Dict[str, object]]:
+        """
+        Scans every URL in urls concurrently and returns a list of
+        results dictionaries, in the same order as urls.  Unlike
+        fetch(), this method does not modify self.results.  Each URL
+        is validated before a request to IP Quality Score is made,
+        to conserve our monthly request limit.
+
+        Parameters
+        ----------
+        urls:        list of strings
+        concurrency: integer (optional), maximum number of
+                     requests in flight at once
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        connector = aiohttp.TCPConnector(limit=concurrency,
+                                         use_dns_cache=True,
+                                         ttl_dns_cache=DNS_TTL)
+
+        async def scan(session: aiohttp.ClientSession,
+                       url: str) -> Dict[str, object]:
+            if not self._is_valid_url(url):
+                return self._no_results(404, f"Invalid url {url}")
+
+            api_url = f'{self._url_prefix}{self._encode_url(url)}'
+            params = {'strictness': self.strictness}
+
+            async with semaphore:
+                try:
+                    async with session.get(api_url, params=params) as response:
+                        # Mirror the sync path: bail out on error
+                        # statuses before paying for the JSON decode,
+                        # so HTML error pages never reach the parser.
+                        if response.status >= 500:
+                            msg = "Upstream error from IP Quality Score API."
+                            return self._no_results(response.status, msg)
+
+                        if response.status == 402:
+                            msg = 'You have exceeded your request quota.'
+                            return self._no_results(402, msg)
+
+                        body = await response.read()
+                        results = _json_loads(body)
+                except asyncio.TimeoutError:
+                    msg = "Timed out waiting for IP Quality Score API."
+                    return self._no_results(503, msg)
+                except aiohttp.ClientError:
+                    msg = "Failed to establish connection to IP Quality Score API."
+                    return self._no_results(503, msg)
+
+            req = 'You have exceeded your request quota'
+            msg = results.get('message', '')
+            if not results.get('success') and req in msg:
+                return self._no_results(402, msg)
+
+            return results
+
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=timeout) as session:
+            return await asyncio.gather(*(scan(session, url) for url in urls))
+
     def _print(self, text: str, rainbow: bool) -> None:
         if rainbow:
             rprint(text, 1)
         else:
-            print(text)
+            sys.stdout.write(text + '\n')
 
     def print(self, rainbow: bool=False) -> None:
         """
@@ -63,106 +279,111 @@ class MalURL:
         ----------
         rainbow: boolean (optional)
         """
-        domain = self.domain()
-        header = f'{domain}\n{"-" * len(domain)}' 
+        g = self.results.get
+        domain = g('domain', '')
+        header = f'{domain}\n{"-" * len(domain)}'
 
-        if not self.success():
-            print(header)
-            print(f'message: {self.message()}')
-            print(f'status:  {self.status_code()}')
+        if not g('success'):
+            sys.stdout.write(f'{header}\n'
+                             f'message: {g("message", "")}\n'
+                             f'status:  {g("status_code", 0)}\n')
             return
 
         # To color the output in a gradient, and avoid
         # just having output with different colored lines,
         # the output string must be built before it is
         # printed.  As opposed to rprint line by line.
-        output = header
-        output += f'\nIP Address: {self.ip_address()}\n'
-        output += f'Category:   {self.category()}\n'
-        output += f'Adult:      {self.adult()}\n'
-        output += f'Malware:    {self.malware()}\n'
-        output += f'Phishing:   {self.phishing()}\n'
-        output += f'Spamming:   {self.spamming()}\n'
-        output += f'Suspicious: {self.suspicious()}\n'
-        output += f'Unsafe:     {self.unsafe()}\n'
-        output += f'Risk score: {self.risk_score()}'
-
-        self._print(output, rainbow)
-
-    def unsafe(self) -> bool:
+        # Building it once also means one write to stdout.
+        lines = (
+            header,
+            f'IP Address: {g("ip_address", "")}',
+            f'Category:   {g("category", NA)}',
+            f'Adult:      {bool(g("adult"))}',
+            f'Malware:    {bool(g("malware"))}',
+            f'Phishing:   {bool(g("phishing"))}',
+            f'Spamming:   {bool(g("spamming"))}',
+            f'Suspicious: {bool(g("suspicious"))}',
+            f'Unsafe:     {bool(g("unsafe"))}',
+            f'Risk score: {g("risk_score", DOES_NOT_EXIST)}',
+        )
+
+        self._print('\n'.join(lines), rainbow)
+
+    unsafe = _field(
+        'unsafe', False, bool,
         """
         Returns boolean value indicating if the domain is suspected of
         being unsafe due to phishing, malware, spamming, or abusive
-        behavior. View the confidence level by analyzing the "risk_score". 
-        
+        behavior. View the confidence level by analyzing the "risk_score".
+
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('unsafe'))
+        """)
 
-    def domain(self) -> str:
-        """
+    domain = _field(
+        'domain', '',
+        doc="""
         Returns a string representing the domain name of the final
         destination URL of the scanned link, after following all redirects.
-        Returns an empty string if 'domain' is not available. 
-        
+        Returns an empty string if 'domain' is not available.
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('domain', '')
+        """)
 
-    def ip_address(self) -> str:
-        """
+    ip_address = _field(
+        'ip_address', '',
+        doc="""
         Returns a string representing the IP address
         corresponding to the server of the domain name.
         Returns an empty string if 'ip_address' is not available.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('ip_address', '')
+        """)
 
-    def server(self) -> str:
-        """
+    server = _field(
+        'server', NA,
+        doc="""
         Returns a string representing server banner of the domain's IP address.
         For example: "nginx/1.16.0".  "N/A" is returned if unavailable.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('server', NA)
+        """)
 
-    def content_type(self) -> str:
-        """
+    content_type = _field(
+        'content_type', NA,
+        doc="""
         Returns a string representing the MIME type of URL's content.
-        For example "text/html; charset=UTF-8". 
+        For example "text/html; charset=UTF-8".
         "N/A" is returned if unavailable.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('content_type', NA)
+        """)
 
-    def risk_score(self) -> int:
-        """
+    risk_score = _field(
+        'risk_score', DOES_NOT_EXIST,
+        doc="""
         Returns an integer representing the The IPQS risk score which estimates
         the confidence level for malicious URL detection. Risk Scores 85+ are
         high risk, while Risk Scores = 100 are confirmed as accurate.  If no
         risk score exists, then DOES_NOT_EXIST will be returned.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('risk_score', DOES_NOT_EXIST)
+        """)
 
-    def status_code(self) -> int:
-        """
+    status_code = _field(
+        'status_code', 0,
+        doc="""
         Returns an integer representing the HTTP Status Code of the URL's
         response. This value should be 200 for a valid website.
         0 is returned if URL is unreachable.
@@ -170,22 +391,22 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return self.results.get('status_code', 0)
+        """)
 
-    def page_size(self) -> int:
-        """
+    page_size = _field(
+        'page_size', 0,
+        doc="""
         Returns an integer representing the Total number of bytes to download
         the URL's content. 0 is returned if URL is unreachable.
 
         Parameters
         ----------
         None.
-        """
-        return self.results.get('page_size', 0)
+        """)
 
-    def domain_rank(self) -> int:
-        """
+    domain_rank = _field(
+        'domain_rank', DOES_NOT_EXIST,
+        doc="""
         Returns an integer representing the estimated popularity rank of
         website globally. Returns 0 if the domain is unranked or has low
         traffic.  Returns DOES_NOT_EXIST if unreachable.
@@ -193,10 +414,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return self.results.get('domain_rank', DOES_NOT_EXIST)
+        """)
 
-    def dns_valid(self) -> bool:
+    dns_valid = _field(
+        'dns_valid', False, bool,
         """
         Returns boolean value indicating if the domain of the URL has valid
         DNS records.
@@ -204,10 +425,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('dns_valid'))
+        """)
 
-    def suspicious(self) -> bool:
+    suspicious = _field(
+        'suspicious', False, bool,
         """
         Returns boolean value indicating if the URL is suspected of being
         malicious or used for phishing or abuse. Use in conjunction with
@@ -216,10 +437,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('suspicious'))
+        """)
 
-    def phishing(self) -> bool:
+    phishing = _field(
+        'phishing', False, bool,
         """
         Returns boolean value indicating if the URL is
         associated with malicious phishing behavior.
@@ -227,10 +448,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('phishing'))
+        """)
 
-    def malware(self) -> bool:
+    malware = _field(
+        'malware', False, bool,
         """
         Returns boolean value indicating if the URL is
         associated with malware or viruses.
@@ -238,10 +459,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('malware'))
+        """)
 
-    def parking(self) -> bool:
+    parking = _field(
+        'parking', False, bool,
         """
         Returns boolean value indicating if the URL is
         currently parked with a for sale notice.
@@ -249,10 +470,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('parking'))
+        """)
 
-    def spamming(self) -> bool:
+    spamming = _field(
+        'spamming', False, bool,
         """
         Returns boolean value indicating if the URL is
         associated with email SPAM or abusive email addresses.
@@ -260,10 +481,10 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('spamming'))
+        """)
 
-    def adult(self) -> bool:
+    adult = _field(
+        'adult', False, bool,
         """
         Returns boolean value indicating if the URL or
         domain is hosting dating or adult content.
@@ -271,86 +492,106 @@ class MalURL:
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('adult'))
+        """)
 
-    def category(self) -> str:
-        """
+    category = _field(
+        'category', NA,
+        doc="""
         Returns a string representing the website classification and category
         related to the content and industry of the site. Over 70 categories
         are available including "Video Streaming", "Trackers", "Gaming",
         "Privacy", "Advertising", "Hacking", "Malicious", "Phishing", etc.
         The value returned will be "N/A" if unknown.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('category', NA)
+        """)
 
     def domain_age(self) -> Dict[str, str]:
         """
         Returns a dictionary representing the domain age of the URL.
         If 'domain_age' is not available, then an empty dictionary
         will be returned.
-        
+
         Parameters
         ----------
         None.
         """
         return self.results.get('domain_age', {})
 
-    def message(self) -> str:
-        """
+    message = _field(
+        'message', '',
+        doc="""
         Returns a generic status message, either success or
         some form of an error notice.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('message', '')
+        """)
 
-    def success(self) -> bool:
+    success = _field(
+        'success', False, bool,
         """
         Returns a boolean indicating if the request to IPQS was successful.
-        
+
         Parameters
         ----------
         None.
-        """
-        return bool(self.results.get('success'))
+        """)
 
-    def request_id(self) -> str:
-        """
+    request_id = _field(
+        'request_id', '',
+        doc="""
         Returns a string representing the unique identifier for this request
         that can be used to lookup the request details or send a postback
         conversion notice.
-        
+
         Parameters
         ----------
         None.
-        """
-        return self.results.get('request_id', '')
+        """)
 
     def errors(self) -> List[str]:
         """
         Returns a list of strings representing the errors which
         occurred while attempting to process this request.
-        
+
         Parameters
         ----------
         None.
         """
         return self.results.get('errors', [])
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _encode_url(url: str) -> str:
+        return quote_plus(url)
+
+    def _fetch(self, url: str, strictness: int, bucket: int) -> tuple:
+        api_url = f'{self._url_prefix}{self._encode_url(url)}'
+        response = self._session.get(api_url,
+                                     params={'strictness': strictness},
+                                     timeout=REQUEST_TIMEOUT)
+
+        # Raising on upstream errors keeps them out of the cache.
+        if response.status_code >= 500:
+            response.raise_for_status()
+
+        return response.status_code, response.content
+
     def _is_valid_url(self, url: str) -> bool:
-        is_valid = validate_url(url)
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            # e.g. an unbalanced bracket in an IPv6 netloc.
+            return False
 
-        if isinstance(is_valid, ValidationFailure):
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
             return False
 
-        return is_valid
+        return bool(_URL_RE.match(url))
 
     def _no_results(self, status_code: int, message: str) -> Dict[str, object]:
         return {
@@ -15,8 +15,8 @@ setup(
     long_description_content_type="text/markdown",
     long_description=DESCRIPTION,
     packages=find_packages(exclude=EXCLUDES),
-    python_requires=">=3.6",
-    install_requires=['requests', 'validators', 'rainbowprint-TechnoHwizrdry'],
+    python_requires=">=3.8",
+    install_requires=['aiohttp', 'requests', 'rainbowprint-TechnoHwizrdry'],
     keywords=['python', 'infosec', 'urls', 'security', 'malicious-url-detection'],
     classifiers=[
         # complete classifier list: http://pypi.python.org/pypi?%3Aaction=list_classifiers
@@ -25,8 +25,6 @@ setup(
         'Intended Audience :: Developers',
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.9',
         'Programming Language :: Python :: 3.10',
@@ -1,5 +1,6 @@
 # Copyright: 2022, Alexan Mardigian
 
+import asyncio
 import unittest
 from configparser import ConfigParser
 import sys
@@ -45,6 +46,23 @@ class TestMalURL(unittest.TestCase):
         }
         self.assertEqual(expected, test)
 
+    def test_MalURL_fetch_many(self):
+        urls = ['https://google.com', 'google']
+        results = asyncio.run(self.malurl.fetch_many(urls))
+        expected = {
+            "success": False,
+            "message": "Invalid url google",
+            "status_code": 404
+        }
+        self.assertEqual(len(urls), len(results))
+        self.assertEqual(OK, results[0].get('status_code'))
+        self.assertEqual(expected, results[1])
+
+    def test_MalURL_fetch_cached(self):
+        first = self.malurl.results
+        self.malurl.fetch('https://google.com')
+        self.assertEqual(first, self.malurl.results)
+
     def test_MalURL_unsafe(self):
         self.assertEqual(False, self.malurl.unsafe())
 
@@ -112,6 +130,11 @@ class TestMalURL(unittest.TestCase):
     def test_MalURL_errors(self):
         self.assertEqual([], self.malurl.errors())
 
+    def test_MalURL_context_manager(self):
+        with MalURL(self.malurl.apikey) as m:
+            m.fetch('https://google.com')
+            self.assertEqual(OK, m.status_code())
+
     def test_MalURL_strictness_less_than_zero(self):
         m = MalURL(self.malurl.apikey, -9)
         m.fetch('https://google.com')